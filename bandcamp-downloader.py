@@ -2,33 +2,68 @@
 
 import argparse
 import html
+import itertools
 import json
 import os
+import pickle
 import re
 import requests
+import shutil
+import sqlite3
 import sys
+import threading
+import time
 import urllib.parse
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # These require pip installs
-from bs4 import BeautifulSoup, SoupStrainer
 import browser_cookie3
 from tqdm import tqdm
 
+# Optional, only used to cache the album/collection pages between runs
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+# Optional, faster decoding of the collection and pagedata JSON
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 USER_URL = 'https://bandcamp.com/{}'
 COLLECTION_POST_URL = 'https://bandcamp.com/api/fancollection/1/collection_items'
-FILENAME_REGEX = re.compile('filename\\*=UTF-8\'\'(.*)')
+COLLECTION_PAGE_SIZE = 100
+FILENAME_REGEX = re.compile(r"filename\*=UTF-8''([^;]+)")
+PAGEDATA_REGEX = re.compile(rb'<div[^>]*id="pagedata"[^>]*data-blob="([^"]*)"')
 CONFIG = {
     'VERBOSE' : False,
     'OUTPUT_DIR' : None,
-    'BROWSER' : None,
     'FORMAT' : None,
     'FORCE' : False,
     'TQDM' : None,
+    'ALBUM_INDEX' : {},
+    'DOWNLOAD_DB' : None,
 }
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bandcamp-downloader')
+ALBUM_INDEX_PATH = os.path.join(CACHE_DIR, 'index.pkl')
+DOWNLOAD_DB_PATH = os.path.join(CACHE_DIR, 'index.db')
+# Download links handed out by bandcamp are signed and eventually expire, so
+# neither cached pages nor indexed links are trusted for longer than this.
+CACHE_EXPIRE_SECONDS = 3600
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Some servers refuse HEAD requests, for those the headers come from the GET
+HEAD_REJECTED_STATUSES = (403, 405, 501)
+# Files larger than this are fetched as several byte ranges in parallel
+RANGED_DOWNLOAD_MIN_SIZE = 32 << 20
+RANGED_DOWNLOAD_PARTS = 4
 MAX_THREADS = 32
-DEFAULT_THREADS = 5
+DEFAULT_THREADS = 10
+METADATA_THREADS = 8
 SUPPORTED_FILE_FORMATS = [
     'aac-hi',
     'aiff-lossless',
@@ -39,14 +74,21 @@ SUPPORTED_FILE_FORMATS = [
     'vorbis',
     'wav',
 ]
-SUPPORTED_BROWSERS = [
-    'firefox',
-    'chrome',
-    'chromium',
-    'brave',
-    'opera',
-    'edge'
-]
+BROWSER_LOADERS = {
+    'firefox' : browser_cookie3.firefox,
+    'chrome' : browser_cookie3.chrome,
+    'chromium' : browser_cookie3.chromium,
+    'brave' : browser_cookie3.brave,
+    'opera' : browser_cookie3.opera,
+    'edge' : browser_cookie3.edge,
+}
+SUPPORTED_BROWSERS = list(BROWSER_LOADERS)
+# Set up by init_session() once the command line has been parsed
+SESSION = None
+ALBUM_INDEX_LOCK = threading.Lock()
+DOWNLOAD_DB_LOCK = threading.Lock()
+MADE_DIRS = set()
+MADE_DIRS_LOCK = threading.Lock()
 
 def main() -> int:
     parser = argparse.ArgumentParser(description = 'Download your collection from bandcamp. Requires a logged in session in a supported browser so that the browser cookies can be used to authenticate with bandcamp. Albums are saved into directories named after their artist. Already existing albums will have their file size compared to what is expected and re-downloaded if the sizes differ. Otherwise already existing albums will not be re-downloaded.')
@@ -73,7 +115,7 @@ def main() -> int:
         '--parallel-downloads', '-p',
         type = int,
         default = DEFAULT_THREADS,
-        help = 'How many threads to use for parallel downloads. Set to \'1\' to disable parallelism. Default is 5. Must be between 1 and {}'.format(MAX_THREADS),
+        help = 'How many threads to use for parallel downloads. Set to \'1\' to disable parallelism. Default is {}. Must be between 1 and {}'.format(DEFAULT_THREADS, MAX_THREADS),
     )
     parser.add_argument(
         '--force',
@@ -89,62 +131,94 @@ def main() -> int:
 
     CONFIG['VERBOSE'] = args.verbose
     CONFIG['OUTPUT_DIR'] = args.directory
-    CONFIG['BROWSER'] = args.browser
     CONFIG['FORMAT'] = args.format
     CONFIG['FORCE'] = args.force
 
-    if CONFIG['VERBOSE']: print(args)
-    if CONFIG['FORCE']: print('WARNING: --force flag set, existing files will be overwritten.')
-    links = get_download_links_for_user(args.username)
-    if CONFIG['VERBOSE']: print('Found [{}] links for [{}]\'s collection.'.format(len(links), args.username))
-    if not links:
-        print('WARN: No album links found for user [{}]. Are you logged in and have you selected the correct browser to pull cookies from?'.format(args.username))
-        sys.exit(2)
-
-    print('Starting album downloads...')
-    CONFIG['TQDM'] = tqdm(links, unit = 'album')
-    if args.parallel_downloads > 1:
-        with ThreadPoolExecutor(max_workers = args.parallel_downloads) as executor:
-            executor.map(download_album, links)
-    else:
-        for link in links:
-            download_album(link)
-    CONFIG['TQDM'].close()
+    init_session(args.parallel_downloads * RANGED_DOWNLOAD_PARTS + METADATA_THREADS, BROWSER_LOADERS[args.browser](domain_name = 'bandcamp.com'))
+    if not CONFIG['FORCE']: CONFIG['ALBUM_INDEX'] = load_album_index()
+    CONFIG['DOWNLOAD_DB'] = open_download_db()
+
+    # Whatever happens below, keep the links resolved so far and close the db
+    try:
+        if CONFIG['VERBOSE']: print(args)
+        if CONFIG['FORCE']: print('WARNING: --force flag set, existing files will be overwritten.')
+        links = get_download_links_for_user(args.username)
+        if not links:
+            print('WARN: No album links found for user [{}]. Are you logged in and have you selected the correct browser to pull cookies from?'.format(args.username))
+            sys.exit(2)
+        if CONFIG['VERBOSE']: print('Found [{}] links for [{}]\'s collection.'.format(len(links), args.username))
+
+        print('Starting album downloads...')
+        # Worker threads update the bar as albums finish, let tqdm batch the redraws
+        CONFIG['TQDM'] = tqdm(links, unit = 'album', miniters = 1, mininterval = 0.2, smoothing = 0)
+        if args.parallel_downloads > 1:
+            # Album pages are small and quick to fetch, so they get their own pool
+            # and can run ahead of the much larger album file downloads. Only a
+            # bounded number of albums are in flight at once though, since the
+            # download links the lookups return expire if left queued too long.
+            max_in_flight = 2 * args.parallel_downloads
+            remaining_links = iter(links)
+            in_flight = {}
+            with ThreadPoolExecutor(max_workers = METADATA_THREADS) as metadata_pool, \
+                    ThreadPoolExecutor(max_workers = args.parallel_downloads) as file_pool:
+                while True:
+                    for link in itertools.islice(remaining_links, max_in_flight - len(in_flight)):
+                        in_flight[metadata_pool.submit(get_album_download, link)] = (link, True)
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        link, is_lookup = in_flight.pop(future)
+                        album_download = wait_for_album(future, link)
+                        if is_lookup and album_download:
+                            in_flight[file_pool.submit(save_album, link, *album_download)] = (link, False)
+        else:
+            for link in links:
+                download_album(link)
+    finally:
+        if CONFIG['TQDM']: CONFIG['TQDM'].close()
+        save_album_index(CONFIG['ALBUM_INDEX'])
+        CONFIG['DOWNLOAD_DB'].close()
     print('Done.')
 
-def generate_collection_post_payload(_user_info : dict) -> None:
+def wait_for_album(_future, _album_url):
+    try:
+        return _future.result()
+    except Exception as e:
+        CONFIG['TQDM'].write('ERROR: Failed to download album at url [{}]: {}'.format(_album_url, e))
+        CONFIG['TQDM'].update()
+
+def generate_collection_post_payload(_user_info : dict, _count : int, _older_than_token : str) -> dict:
     return {
         'fan_id' : _user_info['user_id'],
-        'count' : _user_info['collection_count'] - len(_user_info['download_urls']),
-        'older_than_token' : _user_info['last_token'],
+        'count' : _count,
+        'older_than_token' : _older_than_token,
     }
 
 def get_user_collection(_user_info : dict) -> None:
-    with requests.post(
-        COLLECTION_POST_URL,
-        data = json.dumps(generate_collection_post_payload(_user_info)),
-        cookies = get_cookies(),
-    ) as response:
-        response.raise_for_status()
-        data = json.loads(response.text)
+    # Each page is requested with the token returned by the previous one, so
+    # the pages have to be fetched one after the other.
+    last_token = _user_info['last_token']
+    while len(_user_info['download_urls']) < _user_info['collection_count']:
+        remaining = _user_info['collection_count'] - len(_user_info['download_urls'])
+        with SESSION.post(
+            COLLECTION_POST_URL,
+            data = json.dumps(generate_collection_post_payload(_user_info, min(remaining, COLLECTION_PAGE_SIZE), last_token)),
+        ) as response:
+            response.raise_for_status()
+            data = json_loads(response.content)
         _user_info['download_urls'] += data['redownload_urls'].values()
+        last_token = data.get('last_token')
+        if not data.get('more_available') or not last_token:
+            break
 
 def get_download_links_for_user(_user : str) -> [str]:
     print('Retrieving album links from user [{}]\'s collection.'.format(_user))
 
-    soup = BeautifulSoup(
-        requests.get(
-            USER_URL.format(_user),
-            cookies = get_cookies()
-        ).text,
-        'html.parser',
-        parse_only = SoupStrainer('div', id='pagedata'),
-    )
-    div = soup.find('div')
-    if not div:
+    data = get_pagedata(SESSION.get(USER_URL.format(_user)).content)
+    if data is None:
         print('ERROR: No div with pagedata found for user at url [{}]'.format(USER_URL.format(_user)))
         return
-    data = json.loads(html.unescape(div.get('data-blob')))
 
     user_info = {
         'collection_count' : data['collection_count'],
@@ -154,24 +228,99 @@ def get_download_links_for_user(_user : str) -> [str]:
     user_info['download_urls'] = [ *data['collection_data']['redownload_urls'].values() ]
 
     get_user_collection(user_info)
-    return user_info['download_urls']
+    # Pages can overlap, drop repeated links while keeping the collection order
+    return list(dict.fromkeys(user_info['download_urls']))
+
+def get_pagedata(_content : bytes) -> dict:
+    # All we need from a page is the JSON blob on the pagedata div, so pull it
+    # out with a regex rather than building a DOM for the whole page.
+    match = PAGEDATA_REGEX.search(_content)
+    if not match:
+        return None
+    return json_loads(html.unescape(match.group(1).decode('utf-8')))
+
+def load_album_index() -> dict:
+    try:
+        with open(ALBUM_INDEX_PATH, 'rb') as fh:
+            index = pickle.load(fh)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+    now = time.time()
+    return { key : entry for key, entry in index.items() if now - entry[2] < CACHE_EXPIRE_SECONDS }
+
+def save_album_index(_index : dict) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with ALBUM_INDEX_LOCK:
+        with open(ALBUM_INDEX_PATH, 'wb') as fh:
+            pickle.dump(_index, fh)
+
+def open_download_db() -> sqlite3.Connection:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Shared by all the worker threads, every access goes through DOWNLOAD_DB_LOCK
+    db = sqlite3.connect(DOWNLOAD_DB_PATH, check_same_thread = False)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS downloads (
+            album_url TEXT NOT NULL,
+            format TEXT NOT NULL,
+            directory TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            PRIMARY KEY (album_url, format, directory)
+        )
+    ''')
+    db.commit()
+    return db
+
+def is_album_downloaded(_album_url : str) -> bool:
+    with DOWNLOAD_DB_LOCK:
+        row = CONFIG['DOWNLOAD_DB'].execute(
+            'SELECT file_path, size FROM downloads WHERE album_url = ? AND format = ? AND directory = ?',
+            (_album_url, CONFIG['FORMAT'], os.path.abspath(CONFIG['OUTPUT_DIR'])),
+        ).fetchone()
+    if not row:
+        return False
+    file_path, size = row
+    try:
+        return os.stat(file_path).st_size == size
+    except OSError:
+        return False
+
+def record_album_download(_album_url : str, _file_path : str) -> None:
+    stat = os.stat(_file_path)
+    with DOWNLOAD_DB_LOCK:
+        CONFIG['DOWNLOAD_DB'].execute(
+            'INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)',
+            (_album_url, CONFIG['FORMAT'], os.path.abspath(CONFIG['OUTPUT_DIR']), os.path.abspath(_file_path), stat.st_size, stat.st_mtime),
+        )
+        CONFIG['DOWNLOAD_DB'].commit()
 
 def download_album(_album_url):
-    soup = BeautifulSoup(
-        requests.get(
-            _album_url,
-            cookies = get_cookies()
-        ).text,
-        'html.parser',
-        parse_only = SoupStrainer('div', id='pagedata'),
-    )
-    div = soup.find('div')
-    if not div:
+    album_download = get_album_download(_album_url)
+    if album_download:
+        save_album(_album_url, *album_download)
+
+def get_album_download(_album_url) -> (str, str):
+    if not CONFIG['FORCE'] and is_album_downloaded(_album_url):
+        if CONFIG['VERBOSE'] >= 3: CONFIG['TQDM'].write('Skipping album that was already downloaded from url [{}]'.format(_album_url))
+        CONFIG['TQDM'].update()
+        return
+
+    index_key = (_album_url, CONFIG['FORMAT'])
+    with ALBUM_INDEX_LOCK:
+        entry = CONFIG['ALBUM_INDEX'].get(index_key)
+    if entry:
+        if CONFIG['VERBOSE'] >= 3: CONFIG['TQDM'].write('Using indexed download link for album at url [{}]'.format(_album_url))
+        artist, download_url, _ = entry
+        return artist, download_url
+
+    response = SESSION.get(_album_url)
+    data = get_pagedata(response.content)
+    if data is None:
         CONFIG['TQDM'].write('ERROR: No div with pagedata found for album at url [{}]'.format(_album_url))
         CONFIG['TQDM'].update()
         return
 
-    data = json.loads(html.unescape(div.get('data-blob')))
     artist = data['download_items'][0]['artist']
     album = data['download_items'][0]['title']
 
@@ -181,55 +330,175 @@ def download_album(_album_url):
         return
 
     download_url = data['download_items'][0]['downloads'][CONFIG['FORMAT']]['url']
-    download_file(download_url, artist)
+    # A link from a cached page is already partway through its lifetime, so only
+    # freshly fetched links are indexed. The page cache covers the rest.
+    if not getattr(response, 'from_cache', False):
+        with ALBUM_INDEX_LOCK:
+            CONFIG['ALBUM_INDEX'][index_key] = (artist, download_url, time.time())
+    return artist, download_url
 
-def download_file(_url, _to = None):
-    with requests.get(
-            _url,
-            cookies = get_cookies(),
-            stream = True,
-    ) as response:
-        response.raise_for_status()
+def save_album(_album_url, _artist, _download_url):
+    file_path = download_file(_download_url, os.path.join(CONFIG['OUTPUT_DIR'], _artist))
+    # Only files whose size was verified against bandcamp are trusted enough
+    # to skip contacting bandcamp for on later runs.
+    if file_path:
+        record_album_download(_album_url, file_path)
+    # Failures are counted by whoever catches the exception, see wait_for_album
+    CONFIG['TQDM'].update()
+
+def make_dirs(_path : str) -> None:
+    # Many albums share an artist directory, only create each one once per run
+    with MADE_DIRS_LOCK:
+        if _path in MADE_DIRS:
+            return
+        os.makedirs(_path, exist_ok=True)
+        MADE_DIRS.add(_path)
+
+def download_file(_url, _to) -> str:
+    # Returns the album's path if its size was verified, whether it was
+    # downloaded by this call or already on disk.
+    # Only the headers are needed to work out where the album goes and whether
+    # an existing copy is complete, so don't open the download stream for that
+    # unless the server won't answer a HEAD request.
+    stream = None
+    with SESSION.head(_url, allow_redirects = True) as head:
+        head_rejected = head.status_code in HEAD_REJECTED_STATUSES
+        if head_rejected:
+            if CONFIG['VERBOSE'] >= 3: CONFIG['TQDM'].write('HEAD request for [{}] was rejected with [{}], using GET instead.'.format(_url, head.status_code))
+        else:
+            head.raise_for_status()
+            headers = head.headers
+    if head_rejected:
+        stream = SESSION.get(_url, stream = True)
+        headers = stream.headers
 
-        filename_match = FILENAME_REGEX.search(response.headers['content-disposition'])
-        filename = urllib.parse.unquote(filename_match.group(1)) if filename_match else _url.split('/')[-1]
-        file_path = os.path.join(CONFIG['OUTPUT_DIR'], _to, filename)
+    try:
+        if stream is not None: stream.raise_for_status()
+        return download_file_with_headers(_url, _to, headers, stream)
+    finally:
+        if stream is not None: stream.close()
+
+def download_file_with_headers(_url, _to, _headers, _stream) -> str:
+    filename_match = FILENAME_REGEX.search(_headers.get('content-disposition', ''))
+    if filename_match:
+        filename = filename_match.group(1)
+        if '%' in filename: filename = urllib.parse.unquote(filename)
+    else:
+        filename = _url.split('/')[-1]
+    file_path = os.path.join(_to, filename)
 
-        if os.path.exists(file_path):
-            if CONFIG['FORCE']:
-                if CONFIG['VERBOSE']: CONFIG['TQDM'].write('--force flag was given. Overwriting existing file at [{}].'.format(file_path))
+    if os.path.exists(file_path):
+        if CONFIG['FORCE']:
+            if CONFIG['VERBOSE']: CONFIG['TQDM'].write('--force flag was given. Overwriting existing file at [{}].'.format(file_path))
+        elif 'content-length' in _headers:
+            expected_size = int(_headers['content-length'])
+            actual_size = os.stat(file_path).st_size
+            if expected_size == actual_size:
+                if CONFIG['VERBOSE'] >= 3: CONFIG['TQDM'].write('Skipping album that already exists: [{}]'.format(file_path))
+                return file_path
             else:
-                expected_size = int(response.headers['content-length'])
-                actual_size = os.stat(file_path).st_size
-                if expected_size == actual_size:
-                    if CONFIG['VERBOSE'] >= 3: CONFIG['TQDM'].write('Skipping album that already exists: [{}]'.format(file_path))
-                    CONFIG['TQDM'].update()
-                    return
-                else:
-                    if CONFIG['VERBOSE'] >= 2: CONFIG['TQDM'].write('Album at [{}] is the wrong size. Expected [{}] but was [{}]. Re-downloading.'.format(file_path, expected_size, actual_size))
-
-        if CONFIG['VERBOSE'] >= 2: CONFIG['TQDM'].write('Album being saved to [{}]'.format(file_path))
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'wb') as fh:
-            for chunk in response.iter_content(chunk_size=8192):
+                if CONFIG['VERBOSE'] >= 2: CONFIG['TQDM'].write('Album at [{}] is the wrong size. Expected [{}] but was [{}]. Re-downloading.'.format(file_path, expected_size, actual_size))
+
+    if CONFIG['VERBOSE'] >= 2: CONFIG['TQDM'].write('Album being saved to [{}]'.format(file_path))
+    make_dirs(_to)
+    expected_size = int(_headers.get('content-length', 0))
+    if expected_size > RANGED_DOWNLOAD_MIN_SIZE and _headers.get('accept-ranges') == 'bytes':
+        # Hand the connection back to the pool for the range requests to use
+        if _stream is not None:
+            _stream.close()
+            _stream = None
+        if download_file_ranges(_url, file_path, expected_size):
+            return file_path
+        if CONFIG['VERBOSE'] >= 2: CONFIG['TQDM'].write('Server rejected ranged download of [{}], falling back to a single stream.'.format(file_path))
+    part_path = file_path + '.part'
+    try:
+        with _stream or SESSION.get(
+                _url,
+                stream = True,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(part_path, 'wb') as fh:
+                shutil.copyfileobj(response.raw, fh, DOWNLOAD_CHUNK_SIZE)
+        actual_size = os.stat(part_path).st_size
+        if expected_size and actual_size != expected_size:
+            raise Exception('Download of [{}] was incomplete. Expected [{}] bytes but got [{}].'.format(file_path, expected_size, actual_size))
+    except BaseException:
+        if os.path.exists(part_path): os.remove(part_path)
+        raise
+    os.replace(part_path, file_path)
+    # Without a content-length there is nothing to verify the file against
+    return file_path if expected_size else None
+
+def download_file_ranges(_url, _file_path, _size) -> bool:
+    part_size = -(-_size // RANGED_DOWNLOAD_PARTS)
+    ranges = [ (start, min(start + part_size, _size) - 1) for start in range(0, _size, part_size) ]
+    # The ranges are written into a presized file, which would pass the size
+    # check even with holes in it. So it only takes the album's name once
+    # every range has been verified.
+    part_path = _file_path + '.part'
+    with open(part_path, 'wb') as fh:
+        fh.truncate(_size)
+    try:
+        with ThreadPoolExecutor(max_workers = len(ranges)) as executor:
+            completed = all(list(executor.map(lambda r: download_range(_url, part_path, _size, *r), ranges)))
+    except BaseException:
+        os.remove(part_path)
+        raise
+    if completed:
+        os.replace(part_path, _file_path)
+    else:
+        os.remove(part_path)
+    return completed
+
+def download_range(_url, _file_path, _size, _start, _end) -> bool:
+    with SESSION.get(
+            _url,
+            stream = True,
+            headers = { 'Range' : 'bytes={}-{}'.format(_start, _end), 'Accept-Encoding' : 'identity' },
+    ) as response:
+        # Anything but a 206, errors included, means the single stream fallback
+        if response.status_code != 206:
+            return False
+        if response.headers.get('content-range') != 'bytes {}-{}/{}'.format(_start, _end, _size):
+            return False
+        written = 0
+        with open(_file_path, 'r+b') as fh:
+            fh.seek(_start)
+            for chunk in iter(lambda: response.raw.read(DOWNLOAD_CHUNK_SIZE), b''):
                 fh.write(chunk)
-        CONFIG['TQDM'].update()
+                written += len(chunk)
+    return written == _end - _start + 1
 
-def get_cookies():
-    if CONFIG['BROWSER'] == 'firefox':
-        return browser_cookie3.firefox(domain_name = 'bandcamp.com')
-    elif CONFIG['BROWSER'] == 'chrome':
-        return browser_cookie3.chrome(domain_name = 'bandcamp.com')
-    elif CONFIG['BROWSER'] == 'brave':
-        return browser_cookie3.brave(domain_name = 'bandcamp.com')
-    elif CONFIG['BROWSER'] == 'edge':
-        return browser_cookie3.edge(domain_name = 'bandcamp.com')
-    elif CONFIG['BROWSER'] == 'chromium':
-        return browser_cookie3.chromium(domain_name = 'bandcamp.com')
-    elif CONFIG['BROWSER'] == 'opera':
-        return browser_cookie3.opera(domain_name = 'bandcamp.com')
+def init_session(_pool_size, _cookies):
+    global SESSION
+    if requests_cache and not CONFIG['FORCE']:
+        # Only the album download pages are cached. The user page and collection
+        # are cached without regard to cookies, so caching them would hide new
+        # purchases and keep serving a logged out page after a bad login. The
+        # album files themselves must never end up in the cache.
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        SESSION = requests_cache.CachedSession(
+            os.path.join(CACHE_DIR, 'http_cache'),
+            expire_after = requests_cache.DO_NOT_CACHE,
+            urls_expire_after = { 'bandcamp.com/download' : CACHE_EXPIRE_SECONDS },
+        )
     else:
-        raise Exception('Browser type if [{}] is unknown. Can\'t pull cookies, so can\'t authenticate with bandcamp.'.format(CONFIG['BROWSER']))
+        SESSION = requests.Session()
+    # Share one pool of keep-alive connections across all threads instead of
+    # paying for a fresh TCP + TLS handshake on every request.
+    adapter = HTTPAdapter(
+        pool_connections = _pool_size,
+        pool_maxsize = _pool_size,
+        max_retries = Retry(
+            total = 3,
+            backoff_factor = 0.3,
+            status_forcelist = [429, 500, 502, 503, 504],
+        ),
+    )
+    SESSION.mount('https://', adapter)
+    SESSION.mount('http://', adapter)
+    SESSION.cookies.update(_cookies)
 
 if __name__ == '__main__':
     sys.exit(main())